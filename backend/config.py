@@ -1,31 +1,45 @@
 # backend/config.py
 import os
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Environment variables are snapshotted once per instance at import
+# time via the default factories below, so config reads never hit
+# os.environ (and its lock) on the request path. frozen=True makes the
+# snapshot immutable and slots=True drops the per-instance __dict__.
+
+@dataclass(frozen=True, slots=True)
 class Config:
-    DEBUG = False
-    TESTING = False
-    SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-key-change-this')
-    OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
-    TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
-    TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
-    TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
-    FIREBASE_CREDENTIALS = os.environ.get('FIREBASE_CREDENTIALS')
+    DEBUG: bool = False
+    TESTING: bool = False
+    SECRET_KEY: str = field(default_factory=lambda: os.environ.get('SECRET_KEY', 'dev-key-change-this'))
+    OPENAI_API_KEY: str = field(default_factory=lambda: os.environ.get('OPENAI_API_KEY'))
+    TWILIO_ACCOUNT_SID: str = field(default_factory=lambda: os.environ.get('TWILIO_ACCOUNT_SID'))
+    TWILIO_AUTH_TOKEN: str = field(default_factory=lambda: os.environ.get('TWILIO_AUTH_TOKEN'))
+    TWILIO_PHONE_NUMBER: str = field(default_factory=lambda: os.environ.get('TWILIO_PHONE_NUMBER'))
+    FIREBASE_CREDENTIALS: str = field(default_factory=lambda: os.environ.get('FIREBASE_CREDENTIALS'))
 
+@dataclass(frozen=True, slots=True)
 class DevelopmentConfig(Config):
-    DEBUG = True
+    DEBUG: bool = True
 
+@dataclass(frozen=True, slots=True)
 class TestingConfig(Config):
-    TESTING = True
+    TESTING: bool = True
 
+@dataclass(frozen=True, slots=True)
 class ProductionConfig(Config):
     pass
 
+_development = DevelopmentConfig()
+_testing = TestingConfig()
+_production = ProductionConfig()
+
 config = {
-    'development': DevelopmentConfig,
-    'testing': TestingConfig,
-    'production': ProductionConfig,
-    'default': DevelopmentConfig
-}
\ No newline at end of file
+    'development': _development,
+    'testing': _testing,
+    'production': _production,
+    'default': _development
+}